@@ -1,11 +1,22 @@
+import atexit
+import collections
+import functools
+import queue
+import re
+import shutil
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta
 import random
+import time
 from pathlib import Path
 import os
 import uuid
-from typing import Optional
+from contextlib import contextmanager, suppress
+from typing import Iterator, Optional, TextIO
 
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from flask import (
     Flask,
     flash,
@@ -16,75 +27,317 @@ from flask import (
     session,
     url_for,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.security import check_password_hash
 
 BASE_DIR = Path(__file__).resolve().parent
 DATABASE = BASE_DIR / "musicportal.db"
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "change-me"
-_db_initialized = False
+app.config["MAX_CONTENT_LENGTH"] = 8 * 1024 * 1024
 
 UPLOAD_DIR = BASE_DIR / "static" / "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+UPLOAD_DIR_STR = str(UPLOAD_DIR) + os.sep
+ALLOWED_EXTENSIONS = frozenset(("png", "jpg", "jpeg", "gif", "webp"))
+_EXT_RE = re.compile(r"\.(" + "|".join(ALLOWED_EXTENSIONS) + r")\Z", re.IGNORECASE)
+_SIGNUP_ROLES = frozenset(("band", "fan"))
+_STATUSES = frozenset(("scheduled", "cancelled", "full"))
+# Bands may only toggle these; "full" is derived from ticket sales.
+_BAND_STATUSES = frozenset(("scheduled", "cancelled"))
+
+# Applied to every new connection; journal_mode=WAL is persistent and set in init_db().
+_PRAGMAS = (
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-64000",
+    "mmap_size=134217728",
+    "foreign_keys=ON",
+)
+_PRAGMA_SCRIPT = "".join(f"PRAGMA {pragma};" for pragma in _PRAGMAS)
+
+# Tables holding foreign keys, in dependency order. Deleting a user or concert cascades to these rows;
+# init_db() creates them from here and rebuilds older copies whose keys do not cascade.
+_CHILD_TABLES = {
+    "concerts": """
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            band_name TEXT NOT NULL,
+            concert_datetime TEXT NOT NULL,
+            venue TEXT NOT NULL,
+            city TEXT,
+            cost TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'cancelled', 'full')),
+            image_filename TEXT,
+            user_id INTEGER NOT NULL,
+            max_tickets INTEGER DEFAULT 100,
+            ticket_price REAL DEFAULT 0.0,
+            concert_ts INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', concert_datetime) AS INTEGER)) VIRTUAL,
+            sold_count INTEGER NOT NULL DEFAULT 0,
+            remaining INTEGER GENERATED ALWAYS AS (max_tickets - sold_count) VIRTUAL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    """,
+    "selected_concerts": """
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            concert_id INTEGER NOT NULL,
+            UNIQUE(user_id, concert_id),
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(concert_id) REFERENCES concerts(id) ON DELETE CASCADE
+    """,
+    "tickets": """
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            concert_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL CHECK(qty > 0),
+            purchased_at TEXT NOT NULL,
+            FOREIGN KEY(concert_id) REFERENCES concerts(id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    """,
+}
+
+# Hot statements shared by the routes below; identical text keeps sqlite3's statement cache warm.
+_SQL_USER_BY_ID = "SELECT id, username, role, email, profile_image FROM users WHERE id = ?"
+_SQL_USER_BY_NAME = "SELECT * FROM users WHERE username = ?"
+_SQL_CONCERTS_BY_BAND = (
+    "SELECT id, band_name, concert_datetime, venue, cost, status, image_filename"
+    " FROM concerts WHERE user_id = ? ORDER BY concert_datetime"
+)
+# Rows per page on the fan's selected and tickets lists, which page by (concert_datetime, id) keyset.
+_PAGE_SIZE = 50
+
+_SQL_SELECTED_BY_USER = (
+    "SELECT id, band_name, concert_datetime, venue, cost, status FROM concerts"
+    " WHERE id IN (SELECT concert_id FROM selected_concerts WHERE user_id = ?)"
+    " AND (concert_datetime, id) > (?, ?)"
+    " ORDER BY concert_datetime, id LIMIT ?"
+)
+_SQL_INSERT_SELECTED = "INSERT OR IGNORE INTO selected_concerts (user_id, concert_id) VALUES (?, ?)"
+_SQL_DEL_SELECTED = "DELETE FROM selected_concerts WHERE user_id = ? AND concert_id = ?"
+
+
+# (file name, line-buffered handle) for today's admin log; reopened only when the date rolls over.
+_admin_log: Optional[tuple[str, TextIO]] = None
+_ADMIN_LOG_LOCK = threading.Lock()
+
+
+def _close_admin_log() -> None:
+    if _admin_log is not None:
+        _admin_log[1].close()
+
+
+atexit.register(_close_admin_log)
 
 
 def log_admin_action(action: str):
+    global _admin_log
     if g.user is None or g.user["role"] != "admin":
         return
-    today = datetime.now().strftime("%d-%m-%Y")
-    filename = f"{today}-log.txt"
-    log_path = BASE_DIR / filename
-    timestamp = datetime.now().strftime("%H:%M:%S")
+    now = datetime.now()
+    filename = now.strftime("%d-%m-%Y") + "-log.txt"
+    timestamp = now.strftime("%H:%M:%S")
     try:
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] Admin: {g.user['username']} (ID: {g.user['id']}) - {action}\n")
+        with _ADMIN_LOG_LOCK:
+            if _admin_log is None or _admin_log[0] != filename:
+                _close_admin_log()
+                _admin_log = None
+                _admin_log = (filename, open(BASE_DIR / filename, "a", encoding="utf-8", buffering=1))
+            _admin_log[1].write(f"[{timestamp}] Admin: {g.user['username']} (ID: {g.user['id']}) - {action}\n")
     except Exception as e:
         print(f"Logging failed: {e}")
 
 
-def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+# Argon2id spreads each hash over several lanes, so it costs less wall time than pbkdf2/scrypt.
+_HASHER = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=4)
+# Only for the seeded demo accounts; their hashes are upgraded to _HASHER's parameters on first login.
+_DEMO_HASHER = PasswordHasher(time_cost=1, memory_cost=1024, parallelism=1)
+
+
+def hash_password(password: str) -> str:
+    return _HASHER.hash(password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    # Accounts created before the switch to argon2 still carry werkzeug hashes.
+    if not password_hash.startswith("$argon2"):
+        return check_password_hash(password_hash, password)
+    try:
+        return _HASHER.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+# Verified against when the username does not exist, so unknown and known users take equally long.
+_DUMMY_HASH = hash_password("x" * 32)
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    return not password_hash.startswith("$argon2") or _HASHER.check_needs_rehash(password_hash)
+
+
+def notify(message: str) -> None:
+    """Show a message on this response only; unlike flash() it never touches the session cookie."""
+    g.setdefault("_notices", []).append(message)
+
+
+@app.context_processor
+def inject_notices():
+    return {"notices": g.get("_notices", [])}
+
+
+def save_upload(file, name: str) -> None:
+    """Copy an uploaded file into UPLOAD_DIR in 64 KiB chunks; a failed write leaves no partial file."""
+    path = UPLOAD_DIR_STR + name
+    try:
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file.stream, out, 64 * 1024)
+    except OSError:
+        with suppress(OSError):
+            os.remove(path)
+        raise
+
+
+def remove_upload(name: str) -> None:
+    """Delete a file saved by save_upload() whose database row was never written."""
+    with suppress(OSError):
+        os.remove(UPLOAD_DIR_STR + name)
+
+
+def split_ext(filename: str) -> Optional[str]:
+    """Return the lowercased extension if it is an allowed image type, else None."""
+    match = _EXT_RE.search(filename)
+    return match.group(1).lower() if match else None
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DATABASE, isolation_level=None, check_same_thread=False, cached_statements=128
+    )
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_PRAGMA_SCRIPT)
+    return conn
+
+
+# Connections are borrowed per request and handed back on teardown instead of reopened.
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=8)
+for _ in range(_POOL.maxsize):
+    _POOL.put_nowait(_open_connection())
 
 
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        try:
+            g.db = _POOL.get_nowait()
+        except queue.Empty:
+            g.db = _open_connection()
     return g.db
 
 
+@functools.lru_cache(maxsize=32)
+def _record_type(fields: tuple[str, ...]):
+    return collections.namedtuple("Record", fields)
+
+
+def query_records(db: sqlite3.Connection, sql: str, params=()) -> list:
+    """Run a list query and return lightweight namedtuples instead of sqlite3.Row objects."""
+    cur = db.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    make = _record_type(tuple(col[0] for col in cur.description))._make
+    return [make(row) for row in cur]
+
+
+def parse_db_int(value) -> Optional[int]:
+    """Parse a request value as an int that SQLite can bind (signed 64-bit); None if it is not one."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if -2**63 <= number < 2**63 else None
+
+
+def page_after() -> tuple[str, int]:
+    """Return the keyset cursor from ?after=<concert_datetime>&after_id=<id>; the default precedes every row."""
+    return request.args.get("after", ""), parse_db_int(request.args.get("after_id")) or 0
+
+
+def split_page(rows: list, key) -> tuple[list, Optional[tuple[str, int]]]:
+    """Trim a LIMIT _PAGE_SIZE + 1 result to one page and return the cursor for the next one, if any."""
+    if len(rows) <= _PAGE_SIZE:
+        return rows, None
+    rows = rows[:_PAGE_SIZE]
+    return rows, key(rows[-1])
+
+
+def query_scalar(db: sqlite3.Connection, sql: str, params=()):
+    """Return the first column of the first row (or None) without building a sqlite3.Row."""
+    cur = db.cursor()
+    cur.row_factory = None
+    row = cur.execute(sql, params).fetchone()
+    return None if row is None else row[0]
+
+
+@contextmanager
+def txn(db: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run the enclosed writes as one BEGIN IMMEDIATE ... COMMIT transaction."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        # SQLite may already have rolled back (e.g. SQLITE_FULL); a second ROLLBACK would mask the real error.
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+
+
 @app.teardown_appcontext
 def close_db(error: Optional[BaseException]):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        if db.in_transaction:
+            db.rollback()
+        try:
+            _POOL.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+
+# Stored in PRAGMA user_version once init_db() has migrated and seeded the database; bump it whenever
+# init_db() gains a schema change so existing databases run the migrations again on their next start.
+_SCHEMA_VERSION = 5
 
 
 def init_db():
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f"SQLite 3.35+ is required (found {sqlite3.sqlite_version}).")
     db = get_db()
-    
+    if db.execute("PRAGMA user_version").fetchone()[0] == _SCHEMA_VERSION:
+        return
+    db.execute("PRAGMA journal_mode=WAL")
+    # Foreign keys stay off while the schema is migrated and seeded; they are re-enabled at the end.
+    db.execute("PRAGMA foreign_keys=OFF")
+    # Cleared by any block below that fails, so the version is not stamped and the next start retries.
+    migrated_ok = True
+
     # Migration: Check if users table needs update to include 'admin' role
     try:
         schema = db.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='users'").fetchone()
         if schema and "CHECK(role IN ('band', 'fan'))" in schema["sql"]:
             db.execute("PRAGMA foreign_keys=OFF")
-            db.execute("ALTER TABLE users RENAME TO users_old")
-            db.execute("""
-                CREATE TABLE users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK(role IN ('band', 'fan', 'admin'))
-                )
-            """)
-            db.execute("INSERT INTO users (id, username, password_hash, role) SELECT id, username, password_hash, role FROM users_old")
-            db.execute("DROP TABLE users_old")
-            db.commit()
+            with txn(db):
+                db.execute("ALTER TABLE users RENAME TO users_old")
+                db.execute("""
+                    CREATE TABLE users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT NOT NULL UNIQUE,
+                        password_hash TEXT NOT NULL,
+                        role TEXT NOT NULL CHECK(role IN ('band', 'fan', 'admin'))
+                    )
+                """)
+                db.execute("INSERT INTO users (id, username, password_hash, role) SELECT id, username, password_hash, role FROM users_old")
+                db.execute("DROP TABLE users_old")
     except sqlite3.Error:
-        pass
+        migrated_ok = False
 
     db.executescript(
         """
@@ -94,99 +347,139 @@ def init_db():
             password_hash TEXT NOT NULL,
             role TEXT NOT NULL CHECK(role IN ('band', 'fan', 'admin'))
         );
-
-        CREATE TABLE IF NOT EXISTS concerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            band_name TEXT NOT NULL,
-            concert_datetime TEXT NOT NULL,
-            venue TEXT NOT NULL,
-            city TEXT,
-            cost TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'scheduled' CHECK(status IN ('scheduled', 'cancelled', 'full')),
-            image_filename TEXT,
-            user_id INTEGER NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS selected_concerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            concert_id INTEGER NOT NULL,
-            UNIQUE(user_id, concert_id),
-            FOREIGN KEY(user_id) REFERENCES users(id),
-            FOREIGN KEY(concert_id) REFERENCES concerts(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            concert_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            qty INTEGER NOT NULL CHECK(qty > 0),
-            purchased_at TEXT NOT NULL,
-            FOREIGN KEY(concert_id) REFERENCES concerts(id),
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        );
         """
     )
+    for table, columns in _CHILD_TABLES.items():
+        db.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
     try:
         cols = db.execute("PRAGMA table_info(users)").fetchall()
         col_names = {c[1] for c in cols}
         if "email" not in col_names:
             db.execute("ALTER TABLE users ADD COLUMN email TEXT")
-            db.commit()
         if "profile_image" not in col_names:
             db.execute("ALTER TABLE users ADD COLUMN profile_image TEXT")
-            db.commit()
     except sqlite3.Error:
-        pass
+        migrated_ok = False
 
     try:
-        cols = db.execute("PRAGMA table_info(concerts)").fetchall()
+        cols = db.execute("PRAGMA table_xinfo(concerts)").fetchall()
         col_names = {c[1] for c in cols}
         if "image_filename" not in col_names:
             db.execute("ALTER TABLE concerts ADD COLUMN image_filename TEXT")
-            db.commit()
         if "city" not in col_names:
             db.execute("ALTER TABLE concerts ADD COLUMN city TEXT")
-            db.commit()
         if "max_tickets" not in col_names:
             db.execute("ALTER TABLE concerts ADD COLUMN max_tickets INTEGER DEFAULT 100")
-            db.commit()
         if "ticket_price" not in col_names:
             db.execute("ALTER TABLE concerts ADD COLUMN ticket_price REAL DEFAULT 0.0")
-            db.commit()
             # Migrate cost to ticket_price
-            rows = db.execute("SELECT id, cost FROM concerts").fetchall()
-            for row in rows:
-                try:
-                    price = float(row["cost"].replace("$", "").strip())
-                    db.execute("UPDATE concerts SET ticket_price = ? WHERE id = ?", (price, row["id"]))
-                except:
-                    pass
-            db.commit()
+            db.execute(
+                "UPDATE concerts SET ticket_price = CAST(TRIM(REPLACE(cost, '$', '')) AS REAL)"
+                " WHERE ticket_price = 0 AND cost IS NOT NULL"
+            )
+        if "sold_count" not in col_names:
+            # Running total of tickets.qty, kept in step by the tickets_sold_* triggers below.
+            db.execute("ALTER TABLE concerts ADD COLUMN sold_count INTEGER NOT NULL DEFAULT 0")
+        if "concert_ts" not in col_names:
+            # Unix seconds derived from concert_datetime, so listings can sort on an indexed integer.
+            db.execute(
+                "ALTER TABLE concerts ADD COLUMN concert_ts INTEGER"
+                " GENERATED ALWAYS AS (CAST(strftime('%s', concert_datetime) AS INTEGER)) VIRTUAL"
+            )
+        if "remaining" not in col_names:
+            db.execute(
+                "ALTER TABLE concerts ADD COLUMN remaining INTEGER"
+                " GENERATED ALWAYS AS (max_tickets - sold_count) VIRTUAL"
+            )
     except sqlite3.Error:
-        pass
+        migrated_ok = False
+
+    # Migration: rebuild child tables whose foreign keys do not cascade, or that still point at the
+    # users_old table left behind by the role migration above. Rows whose parent is already gone are dropped.
+    stale = [
+        table for table in _CHILD_TABLES
+        if any(fk["table"] == "users_old" or fk["on_delete"] != "CASCADE"
+               for fk in db.execute(f"PRAGMA foreign_key_list({table})"))
+    ]
+    if stale:
+        with txn(db):
+            for table in stale:
+                cols = ", ".join(row["name"] for row in db.execute(f"PRAGMA table_info({table})"))
+                seq = db.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+                db.execute(f"CREATE TABLE {table}_new ({_CHILD_TABLES[table]})")
+                db.execute(f"INSERT INTO {table}_new ({cols}) SELECT {cols} FROM {table}")
+                db.execute(f"DROP TABLE {table}")
+                db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+                if seq is not None:
+                    db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], table))
+            db.execute("DELETE FROM concerts WHERE user_id NOT IN (SELECT id FROM users)")
+            for table in ("selected_concerts", "tickets"):
+                db.execute(
+                    f"DELETE FROM {table} WHERE user_id NOT IN (SELECT id FROM users)"
+                    " OR concert_id NOT IN (SELECT id FROM concerts)"
+                )
+
+    db.executescript(
+        """
+        CREATE INDEX IF NOT EXISTS idx_concerts_user_dt ON concerts(user_id, concert_datetime);
+        CREATE INDEX IF NOT EXISTS idx_concerts_dt ON concerts(concert_datetime);
+        CREATE INDEX IF NOT EXISTS idx_concerts_date_expr ON concerts(date(concert_datetime));
+        CREATE INDEX IF NOT EXISTS idx_concerts_ts ON concerts(concert_ts, band_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_concerts_status_ts ON concerts(status, concert_ts, band_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_users_role_username ON users(role, username COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_selected_concert ON selected_concerts(concert_id);
+        CREATE INDEX IF NOT EXISTS idx_tickets_concert_qty ON tickets(concert_id, qty);
+        DROP INDEX IF EXISTS idx_tickets_user;
+        CREATE INDEX IF NOT EXISTS idx_tickets_user_concert ON tickets(user_id, concert_id);
+
+        -- Trigram full-text index over the searchable text columns; serves substring LIKE and MATCH lookups.
+        CREATE VIRTUAL TABLE IF NOT EXISTS concerts_fts USING fts5(
+            band_name, venue, city, content='concerts', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS concerts_fts_ai AFTER INSERT ON concerts BEGIN
+            INSERT INTO concerts_fts(rowid, band_name, venue, city) VALUES (new.id, new.band_name, new.venue, new.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS concerts_fts_ad AFTER DELETE ON concerts BEGIN
+            INSERT INTO concerts_fts(concerts_fts, rowid, band_name, venue, city)
+            VALUES ('delete', old.id, old.band_name, old.venue, old.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS concerts_fts_au AFTER UPDATE OF band_name, venue, city ON concerts BEGIN
+            INSERT INTO concerts_fts(concerts_fts, rowid, band_name, venue, city)
+            VALUES ('delete', old.id, old.band_name, old.venue, old.city);
+            INSERT INTO concerts_fts(rowid, band_name, venue, city) VALUES (new.id, new.band_name, new.venue, new.city);
+        END;
+        INSERT INTO concerts_fts(concerts_fts) VALUES ('rebuild');
+
+        CREATE TRIGGER IF NOT EXISTS tickets_sold_ai AFTER INSERT ON tickets BEGIN
+            UPDATE concerts SET sold_count = sold_count + new.qty WHERE id = new.concert_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS tickets_sold_ad AFTER DELETE ON tickets BEGIN
+            UPDATE concerts SET sold_count = sold_count - old.qty WHERE id = old.concert_id;
+        END;
+        UPDATE concerts SET sold_count = (SELECT COALESCE(SUM(qty), 0) FROM tickets WHERE concert_id = concerts.id);
+        """
+    )
     try:
         cities = [
             "London", "Manchester", "Birmingham", "Liverpool", "Leeds", "Bristol",
             "Glasgow", "Edinburgh", "Cardiff", "Belfast"
         ]
         missing = db.execute("SELECT id FROM concerts WHERE city IS NULL OR city = ''").fetchall()
-        for row in missing:
-            city = random.choice(cities)
-            db.execute("UPDATE concerts SET city = ? WHERE id = ?", (city, row["id"]))
-        db.commit()
+        with txn(db):
+            db.executemany(
+                "UPDATE concerts SET city = ? WHERE id = ?",
+                [(random.choice(cities), row["id"]) for row in missing],
+            )
     except sqlite3.Error:
-        pass
+        migrated_ok = False
     try:
         if not db.execute("SELECT 1 FROM users WHERE username='admin' AND role='admin'").fetchone():
             db.execute(
                 "INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'admin')",
-                ("admin", generate_password_hash("1234")),
+                ("admin", hash_password("1234")),
             )
-            db.commit()
     except sqlite3.Error:
-        pass
+        migrated_ok = False
     try:
         count = db.execute("SELECT COUNT(*) as c FROM users WHERE role='band'").fetchone()[0]
         demo_bands = [
@@ -196,14 +489,6 @@ def init_db():
             "QuasarQuartet", "RubyRhythm", "SolarSound", "TopazTempo", "Ultravox", "VioletVibe",
             "WaveWanderers", "XenonXylos", "YellowYodel", "ZenithZing"
         ]
-        if count < 18:
-            for name in demo_bands:
-                if not db.execute("SELECT 1 FROM users WHERE username=?", (name,)).fetchone():
-                    db.execute(
-                        "INSERT INTO users (username, password_hash, role) VALUES (?, ?, 'band')",
-                        (name, generate_password_hash("demo123")),
-                    )
-            db.commit()
         venues = [
             "City Hall", "Riverside Arena", "Sunset Club", "Neon Dome", "Aurora Theater",
             "Echo Park Stage", "Harbor Lights", "Skyline Loft", "Indigo Lounge", "Velvet Room"
@@ -213,47 +498,123 @@ def init_db():
             "Glasgow", "Edinburgh", "Cardiff", "Belfast"
         ]
         now = datetime.now()
-        band_rows = db.execute("SELECT id, username FROM users WHERE role='band'").fetchall()
-        for row in band_rows:
-            uid, uname = row["id"], row["username"]
-            c_count = db.execute("SELECT COUNT(*) FROM concerts WHERE user_id=?", (uid,)).fetchone()[0]
-            if c_count == 0:
+        # Bands and their sample concerts are seeded in one transaction.
+        with txn(db):
+            if count < 18:
+                demo_hash = _DEMO_HASHER.hash("demo123")
+                db.executemany(
+                    "INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, 'band')",
+                    [(name, demo_hash) for name in demo_bands],
+                )
+            band_rows = db.execute(
+                "SELECT id, username FROM users WHERE role='band'"
+                " AND id NOT IN (SELECT user_id FROM concerts)"
+            ).fetchall()
+            concert_rows = []
+            for row in band_rows:
+                uid, uname = row["id"], row["username"]
                 past_dt = (now - timedelta(days=random.randint(20, 180))).replace(minute=0, second=0, microsecond=0)
                 future_dt = (now + timedelta(days=random.randint(5, 120))).replace(minute=0, second=0, microsecond=0)
                 maybe_future_2 = (now + timedelta(days=random.randint(121, 260))).replace(minute=0, second=0, microsecond=0)
-                samples = [
-                    (uname, past_dt.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(15,60)}", random.choice(["scheduled", "full"])) ,
-                    (uname, future_dt.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(20,70)}", "scheduled"),
-                ]
+                concert_rows.append((uname, past_dt.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(15,60)}", random.choice(["scheduled", "full"]), uid))
+                concert_rows.append((uname, future_dt.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(20,70)}", "scheduled", uid))
                 if random.random() < 0.5:
-                    samples.append((uname, maybe_future_2.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(25,80)}", "scheduled"))
-                for band_name, dt, venue, city, cost, status in samples:
-                    db.execute(
-                        "INSERT INTO concerts (band_name, concert_datetime, venue, city, cost, status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (band_name, dt, venue, city, cost, status, uid),
-                    )
-        db.commit()
+                    concert_rows.append((uname, maybe_future_2.strftime("%Y-%m-%dT%H:%M"), random.choice(venues), random.choice(cities), f"${random.randint(25,80)}", "scheduled", uid))
+            db.executemany(
+                "INSERT INTO concerts (band_name, concert_datetime, venue, city, cost, status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                concert_rows,
+            )
     except sqlite3.Error:
-        pass
-    db.commit()
+        migrated_ok = False
+    # Refresh planner statistics so the indexes above are costed against the seeded data.
+    db.execute("ANALYZE")
+    if migrated_ok:
+        db.execute(f"PRAGMA user_version={_SCHEMA_VERSION}")
+    db.execute("PRAGMA foreign_keys=ON")
+
 
+# user_id -> (expires_at, user row as a dict) in LRU order; entries are dropped whenever the user is changed.
+# The cache is per process, which is why the app must be served by a single process (see README).
+_USER_CACHE_TTL = 60.0
+_USER_CACHE_MAX = 512
+_USER_CACHE: "collections.OrderedDict[int, tuple[float, dict]]" = collections.OrderedDict()
+_USER_CACHE_LOCK = threading.Lock()
 
-@app.before_request
-def ensure_db_ready():
-    global _db_initialized
-    if not _db_initialized:
-        init_db()
-        _db_initialized = True
+
+def invalidate_user(user_id: int) -> None:
+    with _USER_CACHE_LOCK:
+        _USER_CACHE.pop(user_id, None)
+
+
+# (expires_at, band rows) for the discover page's artist strip.
+_BANDS_CACHE_TTL = 60.0
+_bands_cache: tuple[float, list] = (0.0, [])
+
+
+def invalidate_band_list() -> None:
+    global _bands_cache
+    _bands_cache = (0.0, [])
+
+
+def band_list() -> list:
+    global _bands_cache
+    now = time.monotonic()
+    if _bands_cache[0] > now:
+        return _bands_cache[1]
+    bands = get_db().execute(
+        "SELECT username, profile_image FROM users WHERE role='band' ORDER BY username COLLATE NOCASE"
+    ).fetchall()
+    _bands_cache = (now + _BANDS_CACHE_TTL, bands)
+    return bands
 
 
-@app.before_request
-def load_logged_in_user():
+def load_logged_in_user() -> Optional[dict]:
     user_id = session.get("user_id")
     if user_id is None:
-        g.user = None
-    else:
-        db = get_db()
-        g.user = db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        return None
+    now = time.monotonic()
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(user_id)
+        if cached is not None and cached[0] > now:
+            _USER_CACHE.move_to_end(user_id)
+            return cached[1]
+    db = get_db()
+    row = db.execute(_SQL_USER_BY_ID, (user_id,)).fetchone()
+    if row is None:
+        return None
+    user = dict(row)
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[user_id] = (now + _USER_CACHE_TTL, user)
+        _USER_CACHE.move_to_end(user_id)
+        if len(_USER_CACHE) > _USER_CACHE_MAX:
+            _USER_CACHE.popitem(last=False)
+    return user
+
+
+class _RequestGlobals(Flask.app_ctx_globals_class):
+    """``g`` that loads ``g.user`` on first access, so views that never read it skip the lookup."""
+
+    def __getattr__(self, name: str):
+        if name == "user":
+            self.user = load_logged_in_user()
+            return self.user
+        return super().__getattr__(name)
+
+
+app.app_ctx_globals_class = _RequestGlobals
+
+
+def role_required(role: str):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            user = g.user
+            if user is None or user["role"] != role:
+                flash(f"{role.title()} access required.")
+                return redirect(url_for("login"))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
 
 
 @app.route("/settings", methods=["GET", "POST"])
@@ -269,18 +630,19 @@ def settings():
         new_filename = g.user["profile_image"]
         
         if file and file.filename:
-            if not allowed_file(file.filename):
+            ext = split_ext(file.filename)
+            if ext is None:
                 flash("Unsupported image type.")
             else:
-                filename = secure_filename(file.filename)
-                ext = filename.rsplit(".", 1)[1].lower()
                 unique_name = f"user_{g.user['id']}_{uuid.uuid4().hex}.{ext}"
-                file.save(str(UPLOAD_DIR / unique_name))
+                save_upload(file, unique_name)
                 new_filename = unique_name
         
         try:
-            db.execute("UPDATE users SET email = ?, profile_image = ? WHERE id = ?", (email, new_filename, g.user["id"]))
-            db.commit()
+            with txn(db):
+                db.execute("UPDATE users SET email = ?, profile_image = ? WHERE id = ?", (email, new_filename, g.user["id"]))
+            invalidate_user(g.user["id"])
+            invalidate_band_list()
             flash("Profile updated.")
         except sqlite3.Error:
             flash("Error updating profile.")
@@ -290,13 +652,10 @@ def settings():
     return render_template("settings.html")
 
 @app.route("/admin/users/<int:user_id>/edit", methods=["GET", "POST"])
+@role_required("admin")
 def admin_edit_user(user_id: int):
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
-        
     db = get_db()
-    user = db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+    user = db.execute(_SQL_USER_BY_ID, (user_id,)).fetchone()
     if not user:
         flash("User not found.")
         return redirect(url_for("admin_users"))
@@ -309,40 +668,43 @@ def admin_edit_user(user_id: int):
         file = request.files.get("profile_image")
         
         if not username or not role:
-            flash("Username and role are required.")
+            notify("Username and role are required.")
         else:
             new_filename = user["profile_image"]
             if file and file.filename:
-                if not allowed_file(file.filename):
+                ext = split_ext(file.filename)
+                if ext is None:
                     flash("Unsupported image type.")
                 else:
-                    filename = secure_filename(file.filename)
-                    ext = filename.rsplit(".", 1)[1].lower()
                     unique_name = f"user_{user_id}_{uuid.uuid4().hex}.{ext}"
-                    file.save(str(UPLOAD_DIR / unique_name))
+                    save_upload(file, unique_name)
                     new_filename = unique_name
             
+            # Hash before BEGIN IMMEDIATE so the write lock is not held for the argon2 computation.
+            new_hash = hash_password(password) if password else None
             try:
-                if password:
-                    db.execute(
-                        "UPDATE users SET username = ?, email = ?, role = ?, profile_image = ?, password_hash = ? WHERE id = ?", 
-                        (username, email, role, new_filename, generate_password_hash(password), user_id)
-                    )
-                    log_admin_action(f"Updated user {user_id} (username: {username}, role: {role}, password changed)")
-                else:
-                    db.execute(
-                        "UPDATE users SET username = ?, email = ?, role = ?, profile_image = ? WHERE id = ?", 
-                        (username, email, role, new_filename, user_id)
-                    )
-                    log_admin_action(f"Updated user {user_id} (username: {username}, role: {role})")
-                
-                db.commit()
+                with txn(db):
+                    if new_hash:
+                        db.execute(
+                            "UPDATE users SET username = ?, email = ?, role = ?, profile_image = ?, password_hash = ? WHERE id = ?", 
+                            (username, email, role, new_filename, new_hash, user_id)
+                        )
+                        log_admin_action(f"Updated user {user_id} (username: {username}, role: {role}, password changed)")
+                    else:
+                        db.execute(
+                            "UPDATE users SET username = ?, email = ?, role = ?, profile_image = ? WHERE id = ?", 
+                            (username, email, role, new_filename, user_id)
+                        )
+                        log_admin_action(f"Updated user {user_id} (username: {username}, role: {role})")
+                invalidate_user(user_id)
+                invalidate_band_list()
+
                 flash("User updated.")
                 return redirect(url_for("admin_users"))
             except sqlite3.IntegrityError:
-                flash("Username already taken.")
+                notify("Username already taken.")
             except sqlite3.Error:
-                flash("Error updating user.")
+                notify("Error updating user.")
                 
     return render_template("admin_user_edit.html", user=user)
 
@@ -365,20 +727,25 @@ def register():
         error = None
         if not username or not password:
             error = "Username and password are required."
-        elif role not in {"band", "fan"}:
+        elif role not in _SIGNUP_ROLES:
             error = "Please choose a role."
-        elif db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone():
+        elif query_scalar(db, "SELECT 1 FROM users WHERE username = ?", (username,)):
             error = "User already exists."
 
         if error is None:
-            db.execute(
-                "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
-                (username, email, generate_password_hash(password), role),
-            )
-            db.commit()
-            flash("Account created. Please log in.")
-            return redirect(url_for("login"))
-        flash(error)
+            password_hash = hash_password(password)
+            with txn(db):
+                row = db.execute(
+                    "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?) RETURNING id",
+                    (username, email, password_hash, role),
+                ).fetchone()
+            if role == "band":
+                invalidate_band_list()
+            session.clear()
+            session["user_id"] = row["id"]
+            flash("Account created. Welcome!")
+            return redirect(url_for("index"))
+        notify(error)
     return render_template("register.html")
 
 
@@ -388,18 +755,26 @@ def login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "")
         db = get_db()
-        user = db.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        user = db.execute(_SQL_USER_BY_NAME, (username,)).fetchone()
         error = None
-        if user is None or not check_password_hash(user["password_hash"], password):
+        password_ok = verify_password(user["password_hash"] if user else _DUMMY_HASH, password)
+        if user is None or not password_ok:
             error = "Invalid credentials."
         if error is None:
+            if password_needs_rehash(user["password_hash"]):
+                new_hash = hash_password(password)
+                with txn(db):
+                    db.execute(
+                        "UPDATE users SET password_hash = ? WHERE id = ?",
+                        (new_hash, user["id"]),
+                    )
             session.clear()
             session["user_id"] = user["id"]
             flash("Welcome back!")
             if user["role"] == "admin":
                 return redirect(url_for("admin_dashboard"))
             return redirect(url_for("index"))
-        flash(error)
+        notify(error)
     return render_template("login.html")
 
 
@@ -410,60 +785,67 @@ def logout():
     return redirect(url_for("index"))
 
 
-def band_required():
-    if g.user is None or g.user["role"] != "band":
-        flash("Band access required.")
-        return False
-    return True
+_SEARCH_BAND, _SEARCH_DATE, _SEARCH_STATUS, _SEARCH_CITY = 8, 4, 2, 1
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
 
 
-def fan_required():
-    if g.user is None or g.user["role"] != "fan":
-        flash("Fan access required.")
+def is_iso_date(value: str) -> bool:
+    if not _DATE_RE.fullmatch(value):
         return False
-    return True
-
-def admin_required():
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
+    try:
+        date.fromisoformat(value)
+    except ValueError:
         return False
     return True
 
 
-def fetch_concerts(band_query: str, date_query: Optional[str], status_filter: str, city_query: Optional[str] = None):
-    db = get_db()
+def _build_search_query(mask: int) -> str:
     query = (
-        "SELECT concerts.*, users.username FROM concerts "
-        "JOIN users ON concerts.user_id = users.id WHERE 1=1"
+        "SELECT concerts.id, band_name, concert_datetime, venue, cost, status, image_filename,"
+        " (sc.id IS NOT NULL) AS is_selected FROM concerts "
+        "JOIN users ON concerts.user_id = users.id "
+        "LEFT JOIN selected_concerts sc ON sc.concert_id = concerts.id AND sc.user_id = ? WHERE 1=1"
     )
-    params = []
+    if mask & _SEARCH_BAND:
+        query += " AND concerts.id IN (SELECT rowid FROM concerts_fts WHERE band_name LIKE ?)"
+    if mask & _SEARCH_DATE:
+        query += " AND date(concert_datetime) = date(?)"
+    if mask & _SEARCH_STATUS:
+        query += " AND status = ?"
+    if mask & _SEARCH_CITY:
+        query += " AND concerts.id IN (SELECT rowid FROM concerts_fts WHERE city LIKE ?)"
+    return query + " ORDER BY concert_ts ASC, band_name COLLATE NOCASE ASC"
+
+
+# One fixed SQL string per combination of active filters, built once at import.
+_SEARCH_QUERIES = {mask: _build_search_query(mask) for mask in range(16)}
+
+
+def fetch_concerts(
+    band_query: str,
+    date_query: Optional[str],
+    status_filter: str,
+    city_query: Optional[str] = None,
+    viewer_id: Optional[int] = None,
+):
+    mask = 0
+    params = [viewer_id]
     if band_query:
-        query += " AND band_name LIKE ?"
+        mask |= _SEARCH_BAND
         params.append(f"%{band_query}%")
     if date_query:
-        try:
-            datetime.strptime(date_query, "%Y-%m-%d")
-            query += " AND date(concert_datetime) = date(?)"
+        if is_iso_date(date_query):
+            mask |= _SEARCH_DATE
             params.append(date_query)
-        except ValueError:
-            flash("Invalid date format. Use YYYY-MM-DD.")
-    if status_filter in {"scheduled", "cancelled", "full"}:
-        query += " AND status = ?"
+        else:
+            notify("Invalid date format. Use YYYY-MM-DD.")
+    if status_filter in _STATUSES:
+        mask |= _SEARCH_STATUS
         params.append(status_filter)
     if city_query:
-        query += " AND (city = ? OR city LIKE ?)"
-        params.extend([city_query, f"%{city_query}%"])
-    query += " ORDER BY datetime(concert_datetime) ASC, band_name COLLATE NOCASE ASC"
-    return get_db().execute(query, params).fetchall()
-
-
-def selected_ids_for_user(user_id: int):
-    db = get_db()
-    selected = db.execute(
-        "SELECT concert_id FROM selected_concerts WHERE user_id = ?",
-        (user_id,),
-    ).fetchall()
-    return {row["concert_id"] for row in selected}
+        mask |= _SEARCH_CITY
+        params.append(f"%{city_query}%")
+    return query_records(get_db(), _SEARCH_QUERIES[mask], params)
 
 
 def render_discover():
@@ -471,25 +853,18 @@ def render_discover():
     date_query = request.args.get("date")
     status_filter = request.args.get("status", "")
     city_query = request.args.get("city", "").strip()
-    concerts = fetch_concerts(band_query, date_query, status_filter, city_query or None)
-    db = get_db()
-    band_rows = db.execute(
-        "SELECT username, profile_image FROM users WHERE role='band' ORDER BY username COLLATE NOCASE"
-    ).fetchall()
-    # bands = [r["username"] for r in band_rows] # Old way
-    bands = band_rows # Pass the rows directly
-    selected_ids = set()
+    viewer_id = None
     if g.user is not None and g.user["role"] == "fan":
-        selected_ids = selected_ids_for_user(g.user["id"])
+        viewer_id = g.user["id"]
+    concerts = fetch_concerts(band_query, date_query, status_filter, city_query or None, viewer_id)
     return render_template(
         "search.html",
         concerts=concerts,
-        bands=bands,
+        bands=band_list(),
         city_query=city_query,
         band_query=band_query,
         date_query=date_query,
         status_filter=status_filter,
-        selected_ids=selected_ids,
     )
 
 
@@ -503,49 +878,32 @@ def artist_concerts(username: str):
     if not user:
         flash("Artist not found.")
         return redirect(url_for("search_concerts"))
-    rows = db.execute(
-        "SELECT * FROM concerts WHERE user_id = ? ORDER BY concert_datetime DESC",
-        (user["id"],),
-    ).fetchall()
-
-    def parse_dt(s: str):
-        try:
-            return datetime.fromisoformat(s)
-        except Exception:
-            try:
-                return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
-
-    now = datetime.now()
-    concerts = []
-    for r in rows:
-        dt = parse_dt(r["concert_datetime"]) or now
-        concerts.append({**dict(r), "archived": dt < now})
-
-    selected_ids = set()
+    viewer_id = None
     if g.user is not None and g.user["role"] == "fan":
-        selected_ids = selected_ids_for_user(g.user["id"])
+        viewer_id = g.user["id"]
+    concerts = db.execute(
+        "SELECT concerts.id, band_name, concert_datetime, venue, cost, status, image_filename,"
+        " datetime(concert_datetime) < datetime('now', 'localtime') AS archived,"
+        " (sc.id IS NOT NULL) AS is_selected FROM concerts"
+        " LEFT JOIN selected_concerts sc ON sc.concert_id = concerts.id AND sc.user_id = ?"
+        " WHERE concerts.user_id = ? ORDER BY concert_datetime DESC",
+        (viewer_id, user["id"]),
+    ).fetchall()
 
-    return render_template("artist_concerts.html", artist=user, concerts=concerts, selected_ids=selected_ids)
+    return render_template("artist_concerts.html", artist=user, concerts=concerts)
 
 
 @app.route("/band")
+@role_required("band")
 def band_dashboard():
-    if not band_required():
-        return redirect(url_for("login"))
     db = get_db()
-    concerts = db.execute(
-        "SELECT * FROM concerts WHERE user_id = ? ORDER BY concert_datetime",
-        (g.user["id"],),
-    ).fetchall()
+    concerts = db.execute(_SQL_CONCERTS_BY_BAND, (g.user["id"],)).fetchall()
     return render_template("band_dashboard.html", concerts=concerts)
 
 
 @app.route("/concerts/new", methods=["GET", "POST"])
+@role_required("band")
 def create_concert():
-    if not band_required():
-        return redirect(url_for("login"))
     if request.method == "POST":
         band_name = request.form.get("band_name", "").strip()
         date_time = request.form.get("concert_datetime")
@@ -564,23 +922,22 @@ def create_concert():
             db = get_db()
             saved_filename = None
             if file and file.filename:
-                if not allowed_file(file.filename):
-                    flash("Unsupported image type. Use PNG/JPG/GIF/WEBP.")
+                ext = split_ext(file.filename)
+                if ext is None:
+                    notify("Unsupported image type. Use PNG/JPG/GIF/WEBP.")
                     return render_template("concert_form.html", concert=None)
-                filename = secure_filename(file.filename)
-                ext = filename.rsplit(".", 1)[1].lower()
                 unique_name = f"{uuid.uuid4().hex}.{ext}"
-                file.save(str(UPLOAD_DIR / unique_name))
+                save_upload(file, unique_name)
                 saved_filename = unique_name
-            db.execute(
-                "INSERT INTO concerts (band_name, concert_datetime, venue, city, cost, max_tickets, ticket_price, status, image_filename, user_id)"
-                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (band_name, date_time, venue, city, cost, max_tickets, ticket_price, status, saved_filename, g.user["id"]),
-            )
-            db.commit()
+            with txn(db):
+                db.execute(
+                    "INSERT INTO concerts (band_name, concert_datetime, venue, city, cost, max_tickets, ticket_price, status, image_filename, user_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (band_name, date_time, venue, city, cost, max_tickets, ticket_price, status, saved_filename, g.user["id"]),
+                )
             flash("Concert created.")
             return redirect(url_for("band_dashboard"))
-        flash(error)
+        notify(error)
     return render_template("concert_form.html", concert=None)
 
 
@@ -620,7 +977,7 @@ def edit_concert(concert_id: int):
         
         # Only allow toggling between scheduled and cancelled
         status_input = request.form.get("status", "scheduled")
-        if status_input not in {"scheduled", "cancelled"}:
+        if status_input not in _BAND_STATUSES:
             status_input = "scheduled"
             
         file = request.files.get("image")
@@ -630,33 +987,38 @@ def edit_concert(concert_id: int):
         if error is None:
             new_filename = concert["image_filename"]
             if file and file.filename:
-                if not allowed_file(file.filename):
-                    flash("Unsupported image type. Use PNG/JPG/GIF/WEBP.")
+                ext = split_ext(file.filename)
+                if ext is None:
+                    notify("Unsupported image type. Use PNG/JPG/GIF/WEBP.")
                     return render_template("concert_form.html", concert=concert)
-                filename = secure_filename(file.filename)
-                ext = filename.rsplit(".", 1)[1].lower()
                 unique_name = f"{uuid.uuid4().hex}.{ext}"
-                file.save(str(UPLOAD_DIR / unique_name))
+                save_upload(file, unique_name)
                 new_filename = unique_name
             
-            # Recalculate status if setting to scheduled
-            final_status = status_input
-            if final_status == "scheduled":
-                # Check if actually full
-                sold = db.execute("SELECT COALESCE(SUM(qty), 0) FROM tickets WHERE concert_id = ?", (concert_id,)).fetchone()[0]
-                try:
-                    mt = int(max_tickets)
-                except:
-                    mt = 100
-                if sold >= mt:
-                    final_status = "full"
-
-            db.execute(
-                "UPDATE concerts SET band_name = ?, concert_datetime = ?, venue = ?, city = ?, cost = ?, max_tickets = ?, ticket_price = ?, status = ?, image_filename = ?"
-                " WHERE id = ?",
-                (band_name, date_time, venue, city, cost, max_tickets, ticket_price, final_status, new_filename, concert_id),
-            )
-            db.commit()
+            with txn(db):
+                # Re-read under the write lock: the concert may have sold out or been deleted since it was loaded.
+                sold = query_scalar(db, "SELECT sold_count FROM concerts WHERE id = ?", (concert_id,))
+                if sold is None:
+                    if new_filename != concert["image_filename"]:
+                        remove_upload(new_filename)
+                    flash("Concert not found.")
+                    return redirect(url_for("index"))
+                # Recalculate status if setting to scheduled
+                final_status = status_input
+                if final_status == "scheduled":
+                    # Check if actually full
+                    try:
+                        mt = int(max_tickets)
+                    except ValueError:
+                        mt = 100
+                    if sold >= mt:
+                        final_status = "full"
+
+                db.execute(
+                    "UPDATE concerts SET band_name = ?, concert_datetime = ?, venue = ?, city = ?, cost = ?, max_tickets = ?, ticket_price = ?, status = ?, image_filename = ?"
+                    " WHERE id = ?",
+                    (band_name, date_time, venue, city, cost, max_tickets, ticket_price, final_status, new_filename, concert_id),
+                )
             
             if is_admin:
                 log_admin_action(f"Edited concert {concert_id} (status: {final_status})")
@@ -665,7 +1027,7 @@ def edit_concert(concert_id: int):
             if is_admin:
                 return redirect(url_for("admin_concerts"))
             return redirect(url_for("band_dashboard"))
-        flash(error)
+        notify(error)
     return render_template("concert_form.html", concert=concert)
 
 
@@ -676,56 +1038,54 @@ def search_concerts():
     return render_discover()
 
 @app.route("/admin")
+@role_required("admin")
 def admin_dashboard():
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     return render_template("admin_dashboard.html")
 
 @app.route("/admin/users")
+@role_required("admin")
 def admin_users():
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     db = get_db()
     q = request.args.get("q", "").strip()
+    # The template only iterates once, so rows are streamed from the cursor rather than fetched up front.
     users = db.execute(
         "SELECT id, username, role, profile_image FROM users WHERE username LIKE ? ORDER BY role DESC, username COLLATE NOCASE",
         (f"%{q}%",),
-    ).fetchall()
+    )
     return render_template("admin_users.html", users=users, q=q)
 
 @app.route("/admin/concerts")
+@role_required("admin")
 def admin_concerts():
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     db = get_db()
     q = request.args.get("q", "").strip()
+    if len(q) >= 3:
+        # The trigram index answers substring matches directly; shorter terms have no trigram to look up.
+        where, params = "c.id IN (SELECT rowid FROM concerts_fts WHERE concerts_fts MATCH ?)", ('"' + q.replace('"', '""') + '"',)
+    else:
+        where, params = "c.band_name LIKE ? OR c.venue LIKE ? OR c.city LIKE ?", (f"%{q}%",) * 3
     concerts = db.execute(
-        """
-        SELECT c.*, u.username, 
-        (SELECT COUNT(*) FROM tickets t WHERE t.concert_id = c.id) as sold_count
+        f"""
+        SELECT c.*, u.username
         FROM concerts c 
         JOIN users u ON c.user_id=u.id 
-        WHERE c.band_name LIKE ? OR c.venue LIKE ? OR c.city LIKE ?
-        ORDER BY datetime(c.concert_datetime) ASC, c.band_name COLLATE NOCASE ASC
+        WHERE {where}
+        ORDER BY c.concert_ts ASC, c.band_name COLLATE NOCASE ASC
         """,
-        (f"%{q}%", f"%{q}%", f"%{q}%"),
+        params,
     ).fetchall()
     return render_template("admin_concerts.html", concerts=concerts, q=q)
 
 @app.route("/admin/users/<int:user_id>/delete", methods=["POST"]) 
+@role_required("admin")
 def admin_delete_user(user_id:int):
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     db = get_db()
     try:
-        db.execute("DELETE FROM selected_concerts WHERE user_id=?", (user_id,))
-        db.execute("DELETE FROM concerts WHERE user_id=?", (user_id,))
-        db.execute("DELETE FROM users WHERE id=?", (user_id,))
-        db.commit()
+        with txn(db):
+            # Concerts, selections and tickets go with the user via ON DELETE CASCADE.
+            db.execute("DELETE FROM users WHERE id=?", (user_id,))
+        invalidate_user(user_id)
+        invalidate_band_list()
         log_admin_action(f"Deleted user {user_id}")
         flash("User deleted.")
     except sqlite3.Error:
@@ -733,15 +1093,12 @@ def admin_delete_user(user_id:int):
     return redirect(url_for("admin_users"))
 
 @app.route("/admin/concerts/<int:concert_id>/delete", methods=["POST"]) 
+@role_required("admin")
 def admin_delete_concert(concert_id:int):
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     db = get_db()
     try:
-        db.execute("DELETE FROM selected_concerts WHERE concert_id=?", (concert_id,))
-        db.execute("DELETE FROM concerts WHERE id=?", (concert_id,))
-        db.commit()
+        with txn(db):
+            db.execute("DELETE FROM concerts WHERE id=?", (concert_id,))
         log_admin_action(f"Deleted concert {concert_id}")
         flash("Concert deleted.")
     except sqlite3.Error:
@@ -749,18 +1106,16 @@ def admin_delete_concert(concert_id:int):
     return redirect(url_for("admin_concerts"))
 
 @app.route("/admin/concerts/<int:concert_id>/status", methods=["POST"]) 
+@role_required("admin")
 def admin_update_status(concert_id:int):
-    if g.user is None or g.user["role"] != "admin":
-        flash("Admin access required.")
-        return redirect(url_for("login"))
     status = request.form.get("status", "scheduled")
-    if status not in {"scheduled","cancelled","full"}:
+    if status not in _STATUSES:
         flash("Invalid status.")
         return redirect(url_for("admin_concerts"))
     db = get_db()
     try:
-        db.execute("UPDATE concerts SET status=? WHERE id=?", (status, concert_id))
-        db.commit()
+        with txn(db):
+            db.execute("UPDATE concerts SET status=? WHERE id=?", (status, concert_id))
         log_admin_action(f"Updated concert {concert_id} status to {status}")
         flash("Status updated.")
     except sqlite3.Error:
@@ -769,53 +1124,62 @@ def admin_update_status(concert_id:int):
 
 
 @app.route("/selected")
+@role_required("fan")
 def selected_concerts_view():
-    if not fan_required():
-        return redirect(url_for("login"))
     db = get_db()
-    concerts = db.execute(
-        """
-        SELECT concerts.* FROM selected_concerts
-        JOIN concerts ON concerts.id = selected_concerts.concert_id
-        WHERE selected_concerts.user_id = ?
-        ORDER BY concert_datetime
-        """,
-        (g.user["id"],),
-    ).fetchall()
-    return render_template("selected.html", concerts=concerts)
+    concerts = query_records(db, _SQL_SELECTED_BY_USER, (g.user["id"], *page_after(), _PAGE_SIZE + 1))
+    concerts, next_page = split_page(concerts, lambda c: (c.concert_datetime, c.id))
+    return render_template("selected.html", concerts=concerts, next_page=next_page)
 
 
 @app.route("/selected/add/<int:concert_id>", methods=["POST"])
+@role_required("fan")
 def add_selected(concert_id: int):
-    if not fan_required():
-        return redirect(url_for("login"))
     db = get_db()
-    concert = db.execute("SELECT id FROM concerts WHERE id = ?", (concert_id,)).fetchone()
-    if concert is None:
+    try:
+        # OR IGNORE covers duplicates only; an unknown concert_id still fails the foreign key.
+        db.execute(_SQL_INSERT_SELECTED, (g.user["id"], concert_id))
+        flash("Added to Selected Concerts.")
+    except sqlite3.IntegrityError:
         flash("Concert not found.")
         return redirect(url_for("search_concerts"))
+    except sqlite3.Error:
+        flash("Unable to add concert.")
+    return redirect(request.referrer or url_for("search_concerts"))
+
+
+@app.route("/selected/add_many", methods=["POST"])
+@role_required("fan")
+def add_selected_many():
+    concert_ids = []
+    for raw_id in request.form.getlist("concert_id"):
+        concert_id = parse_db_int(raw_id)
+        if concert_id is not None:
+            concert_ids.append(concert_id)
+    if not concert_ids:
+        flash("No concerts selected.")
+        return redirect(request.referrer or url_for("search_concerts"))
+    db = get_db()
+    user_id = g.user["id"]
     try:
-        db.execute(
-            "INSERT OR IGNORE INTO selected_concerts (user_id, concert_id) VALUES (?, ?)",
-            (g.user["id"], concert_id),
-        )
-        db.commit()
+        # One transaction for the whole batch; ids without a matching concert are skipped.
+        with txn(db):
+            db.executemany(
+                "INSERT OR IGNORE INTO selected_concerts (user_id, concert_id) SELECT ?, id FROM concerts WHERE id = ?",
+                [(user_id, concert_id) for concert_id in concert_ids],
+            )
         flash("Added to Selected Concerts.")
     except sqlite3.Error:
-        flash("Unable to add concert.")
+        flash("Unable to add concerts.")
     return redirect(request.referrer or url_for("search_concerts"))
 
 
 @app.route("/selected/remove/<int:concert_id>", methods=["POST"])
+@role_required("fan")
 def remove_selected(concert_id: int):
-    if not fan_required():
-        return redirect(url_for("login"))
     db = get_db()
-    db.execute(
-        "DELETE FROM selected_concerts WHERE user_id = ? AND concert_id = ?",
-        (g.user["id"], concert_id),
-    )
-    db.commit()
+    with txn(db):
+        db.execute(_SQL_DEL_SELECTED, (g.user["id"], concert_id))
     flash("Removed from Selected Concerts.")
     return redirect(request.referrer or url_for("selected_concerts_view"))
 
@@ -828,57 +1192,50 @@ def view_concert(concert_id: int):
         flash("Concert not found.")
         return redirect(url_for("search_concerts"))
     
-    sold = db.execute("SELECT COALESCE(SUM(qty), 0) FROM tickets WHERE concert_id = ?", (concert_id,)).fetchone()[0]
-    remaining = concert["max_tickets"] - sold
-    
-    return render_template("concert_detail.html", concert=concert, remaining=remaining)
+    return render_template("concert_detail.html", concert=concert)
 
 
 @app.route("/buy/<int:concert_id>", methods=["POST"])
+@role_required("fan")
 def buy_ticket(concert_id: int):
-    if not fan_required():
-        return redirect(url_for("login"))
-    
     try:
         qty = int(request.form.get("qty", 1))
     except ValueError:
         qty = 1
 
-    if qty < 1:
+    # qty is bound into SQL below, so it must fit an SQLite INTEGER; no concert sells 2**31 seats anyway.
+    if qty < 1 or qty > 2**31:
         flash("Invalid quantity.")
         return redirect(url_for("view_concert", concert_id=concert_id))
         
     db = get_db()
-    concert = db.execute("SELECT * FROM concerts WHERE id = ?", (concert_id,)).fetchone()
-    if not concert:
-        flash("Concert not found.")
-        return redirect(url_for("search_concerts"))
-        
-    sold = db.execute("SELECT COALESCE(SUM(qty), 0) FROM tickets WHERE concert_id = ?", (concert_id,)).fetchone()[0]
-    remaining = concert["max_tickets"] - sold
-    
-    if concert["status"] == "cancelled":
-        flash("Concert is cancelled.")
-        return redirect(url_for("view_concert", concert_id=concert_id))
-        
-    if remaining <= 0:
-        flash("Sold out.")
-        return redirect(url_for("view_concert", concert_id=concert_id))
-        
-    to_buy = min(qty, remaining)
-    
-    db.execute(
-        "INSERT INTO tickets (concert_id, user_id, qty, purchased_at) VALUES (?, ?, ?, datetime('now'))",
-        (concert_id, g.user["id"], to_buy)
-    )
-    
-    # Check if sold out after purchase
-    new_sold = sold + to_buy
-    if new_sold >= concert["max_tickets"]:
-        db.execute("UPDATE concerts SET status = 'full' WHERE id = ?", (concert_id,))
-        
-    db.commit()
-    
+    # The capacity check lives in the INSERT's WHERE clause, so concurrent buyers cannot oversell.
+    with txn(db):
+        row = db.execute(
+            """
+            INSERT INTO tickets (concert_id, user_id, qty, purchased_at)
+            SELECT id, ?, MIN(?, remaining), datetime('now')
+            FROM concerts
+            WHERE id = ? AND status != 'cancelled' AND remaining > 0
+            RETURNING qty
+            """,
+            (g.user["id"], qty, concert_id)
+        ).fetchone()
+
+        if row is None:
+            concert = db.execute("SELECT status FROM concerts WHERE id = ?", (concert_id,)).fetchone()
+            if not concert:
+                flash("Concert not found.")
+                return redirect(url_for("search_concerts"))
+            flash("Concert is cancelled." if concert["status"] == "cancelled" else "Sold out.")
+            return redirect(url_for("view_concert", concert_id=concert_id))
+
+        to_buy = row["qty"]
+        db.execute(
+            "UPDATE concerts SET status = 'full' WHERE id = ? AND status != 'full' AND remaining <= 0",
+            (concert_id,)
+        )
+
     if to_buy < qty:
         flash(f"Partial purchase. Only {to_buy} tickets were available.")
     else:
@@ -888,23 +1245,28 @@ def buy_ticket(concert_id: int):
 
 
 @app.route("/fan-dashboard/tickets-bought")
+@role_required("fan")
 def tickets_bought():
-    if not fan_required():
-        return redirect(url_for("login"))
-        
     db = get_db()
     tickets = db.execute("""
-        SELECT t.*, c.band_name, c.concert_datetime, c.venue, c.city, c.image_filename 
+        SELECT t.id, t.concert_id, t.qty, c.band_name, c.concert_datetime, c.venue, c.city, c.image_filename
         FROM tickets t
         JOIN concerts c ON t.concert_id = c.id
-        WHERE t.user_id = ?
-        ORDER BY c.concert_datetime
-    """, (g.user["id"],)).fetchall()
-    
-    return render_template("tickets_bought.html", tickets=tickets)
+        WHERE t.user_id = ? AND (c.concert_datetime, t.id) > (?, ?)
+        ORDER BY c.concert_datetime, t.id
+        LIMIT ?
+    """, (g.user["id"], *page_after(), _PAGE_SIZE + 1)).fetchall()
+    tickets, next_page = split_page(tickets, lambda t: (t["concert_datetime"], t["id"]))
+    return render_template("tickets_bought.html", tickets=tickets, next_page=next_page)
+
+
+with app.app_context():
+    init_db()
 
 
 if __name__ == "__main__":
-    with app.app_context():
-        init_db()
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Multi-threaded production server; WAL lets the worker threads read
+    # concurrently. Use `flask --app app run --debug` for local development.
+    from waitress import serve
+
+    serve(app, host="0.0.0.0", port=5000, threads=16)
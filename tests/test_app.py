@@ -0,0 +1,139 @@
+"""Route tests run against a throwaway copy of the app, so the committed musicportal.db is never touched.
+
+Run with ``python -m unittest discover tests`` (pytest also collects them).
+"""
+import html
+import importlib.util
+import io
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import uuid
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+OVERSIZED = "9" * 25
+
+
+def _load_app():
+    # app.py opens its database and upload directory next to itself at import time.
+    workdir = Path(tempfile.mkdtemp(prefix="musicportal-test-"))
+    shutil.copy(REPO / "app.py", workdir / "app.py")
+    shutil.copytree(REPO / "templates", workdir / "templates")
+    spec = importlib.util.spec_from_file_location("musicportal_app", workdir / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.app.config["TESTING"] = True
+    return workdir, module
+
+
+def setUpModule():
+    global WORKDIR, m
+    WORKDIR, m = _load_app()
+
+
+def tearDownModule():
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+class TxnTest(unittest.TestCase):
+    def test_error_survives_an_automatic_rollback(self):
+        db = m._open_connection()
+        try:
+            with self.assertRaises(ZeroDivisionError):
+                with m.txn(db):
+                    db.execute("ROLLBACK")  # stands in for SQLite aborting the transaction itself
+                    1 / 0
+            self.assertFalse(db.in_transaction)
+        finally:
+            db.close()
+
+
+class FanRoutesTest(unittest.TestCase):
+    def setUp(self):
+        self.client = m.app.test_client()
+        self.username = "fan_" + uuid.uuid4().hex[:8]
+        # Registering logs the new account in.
+        self.client.post("/register", data={"username": self.username, "password": "pw", "role": "fan"})
+        self.user_id = m.sqlite3.connect(m.DATABASE).execute(
+            "SELECT id FROM users WHERE username = ?", (self.username,)
+        ).fetchone()[0]
+
+    def open_concert_id(self):
+        return m.sqlite3.connect(m.DATABASE).execute(
+            "SELECT id FROM concerts WHERE status = 'scheduled' AND remaining > 0 LIMIT 1"
+        ).fetchone()[0]
+
+    def test_buy_rejects_oversized_qty(self):
+        concert_id = self.open_concert_id()
+        response = self.client.post(f"/buy/{concert_id}", data={"qty": OVERSIZED})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(f"/concert/{concert_id}", response.headers["Location"])
+        tickets = m.sqlite3.connect(m.DATABASE).execute(
+            "SELECT COUNT(*) FROM tickets WHERE user_id = ?", (self.user_id,)
+        ).fetchone()[0]
+        self.assertEqual(tickets, 0)
+
+    def test_lists_page_by_keyset(self):
+        concert_ids = [row[0] for row in m.sqlite3.connect(m.DATABASE).execute("SELECT id FROM concerts LIMIT 5")]
+        for concert_id in concert_ids:
+            self.client.post(f"/selected/add/{concert_id}")
+        page_size, m._PAGE_SIZE = m._PAGE_SIZE, 2
+        try:
+            seen, url = [], "/selected"
+            while url:
+                body = self.client.get(url).get_data(as_text=True)
+                seen += [int(i) for i in re.findall(r"/selected/remove/(\d+)", body)]
+                next_link = re.search(r'href="([^"]*after_id=[^"]*)"', body)
+                url = next_link and html.unescape(next_link.group(1))
+        finally:
+            m._PAGE_SIZE = page_size
+        self.assertEqual(sorted(seen), sorted(concert_ids))
+
+    def test_lists_ignore_oversized_cursor(self):
+        for path in ("/selected", "/fan-dashboard/tickets-bought"):
+            response = self.client.get(f"{path}?after=x&after_id={OVERSIZED}")
+            self.assertEqual(response.status_code, 200, path)
+
+    def test_add_many_skips_oversized_ids(self):
+        concert_id = self.open_concert_id()
+        response = self.client.post(
+            "/selected/add_many", data={"concert_id": [str(concert_id), "x", OVERSIZED]}
+        )
+        self.assertEqual(response.status_code, 302)
+        selected = m.sqlite3.connect(m.DATABASE).execute(
+            "SELECT concert_id FROM selected_concerts WHERE user_id = ?", (self.user_id,)
+        ).fetchall()
+        self.assertEqual(selected, [(concert_id,)])
+
+
+
+class EditConcertTest(unittest.TestCase):
+    def test_upload_removed_when_concert_deleted_mid_edit(self):
+        client = m.app.test_client()
+        client.post("/login", data={"username": "admin", "password": "1234"})
+        concert_id = m.sqlite3.connect(m.DATABASE).execute("SELECT id FROM concerts LIMIT 1").fetchone()[0]
+        before = set(m.UPLOAD_DIR.iterdir())
+        query_scalar = m.query_scalar
+        m.query_scalar = lambda *args: None  # the row vanishes between the form load and the write
+        try:
+            response = client.post(
+                f"/concerts/{concert_id}/edit",
+                data={
+                    "band_name": "B", "concert_datetime": "2031-01-01T20:00", "venue": "V", "city": "C",
+                    "cost": "$1", "max_tickets": "10", "status": "scheduled",
+                    "image": (io.BytesIO(b"img"), "poster.png"),
+                },
+                content_type="multipart/form-data",
+            )
+        finally:
+            m.query_scalar = query_scalar
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(m.UPLOAD_DIR.iterdir()), before)
+
+
+if __name__ == "__main__":
+    unittest.main()